@@ -5,14 +5,15 @@ Smart Upsell Agent - Streamlit Frontend with Sidebar, Main Title, and dotenv int
 
 import os
 import time
+import logging
 import datetime
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 
 import streamlit as st
+import numpy as np
 import pandas as pd
-import psycopg2
-import requests
-import matplotlib.pyplot as plt
 from dotenv import load_dotenv
 
 # -------------------------
@@ -46,104 +47,349 @@ CAMPAIGN_TRIGGER_WEBHOOK = os.getenv(
 USER_ACTIVITY_WEBHOOK = os.getenv(
     "USER_ACTIVITY_WEBHOOK"
 )
+HTTP_TIMEOUT = (3, 8)  # (connect, read) seconds for webhook calls
 
 # -------------------------
 # Demo Data
 # -------------------------
-_demo_user_activities = pd.DataFrame([
-    {"id": 1, "user_id": "sarah_designer", "feature_used": "export_report", "email": "sarah@example.com",
-     "timestamp": datetime.datetime.utcnow()},
-    {"id": 2, "user_id": "john_agency", "feature_used": "file_share", "email": "john@example.com",
-     "timestamp": datetime.datetime.utcnow()},
-])
-_demo_upsell_ops = pd.DataFrame([
-    {"id": 1, "user_id": "sarah_designer", "ai_score": 92, "email": "sarah@example.com",
-     "recommended_feature": "Pro Exports", "reasoning": "Frequent exports", "created_at": datetime.datetime.utcnow(),
-     "status": "active"},
-    {"id": 2, "user_id": "john_agency", "ai_score": 65, "email": "john@example.com", "recommended_feature": "Team Plan",
-     "reasoning": "Multiple teammates", "created_at": datetime.datetime.utcnow() - datetime.timedelta(hours=2),
-     "status": "active"},
-])
-_demo_campaigns = pd.DataFrame([
-    {"id": 1, "opportunity_id": 1, "user_id": "sarah_designer", "recommended_feature": "Pro Exports",
-     "subject_line": "Try Pro Exports", "email_message": "Upgrade to pro to export...", "email_to": "sarah@example.com",
-     "campaign_type": "email", "ai_score": 92, "sent_at": datetime.datetime.utcnow(), "delivery_status": "sent",
-     "open_count": 1, "click_count": 1, "created_at": datetime.datetime.utcnow()},
-])
+# Fixed timestamp keeps the demo frames (and anything cached on them) stable.
+# All frames are Arrow-backed so st.dataframe can ship them without a
+# per-cell pandas -> Arrow conversion.
+_DEMO_NOW = datetime.datetime.fromisoformat("2025-01-01T09:00:00")
+
+@st.cache_data
+def _demo_user_activities() -> pd.DataFrame:
+    return pd.DataFrame([
+        {"id": 1, "user_id": "sarah_designer", "feature_used": "export_report", "email": "sarah@example.com",
+         "timestamp": _DEMO_NOW},
+        {"id": 2, "user_id": "john_agency", "feature_used": "file_share", "email": "john@example.com",
+         "timestamp": _DEMO_NOW},
+    ]).convert_dtypes(dtype_backend="pyarrow")
+
+@st.cache_data
+def _demo_upsell_ops() -> pd.DataFrame:
+    return pd.DataFrame([
+        {"id": 1, "user_id": "sarah_designer", "ai_score": 92, "email": "sarah@example.com",
+         "recommended_feature": "Pro Exports", "reasoning": "Frequent exports", "created_at": _DEMO_NOW,
+         "status": "active"},
+        {"id": 2, "user_id": "john_agency", "ai_score": 65, "email": "john@example.com", "recommended_feature": "Team Plan",
+         "reasoning": "Multiple teammates", "created_at": _DEMO_NOW - datetime.timedelta(hours=2),
+         "status": "active"},
+    ]).convert_dtypes(dtype_backend="pyarrow")
+
+@st.cache_data
+def _demo_campaigns() -> pd.DataFrame:
+    return pd.DataFrame([
+        {"id": 1, "opportunity_id": 1, "user_id": "sarah_designer", "recommended_feature": "Pro Exports",
+         "subject_line": "Try Pro Exports", "email_message": "Upgrade to pro to export...", "email_to": "sarah@example.com",
+         "campaign_type": "email", "ai_score": 92, "sent_at": _DEMO_NOW, "delivery_status": "sent",
+         "open_count": 1, "click_count": 1, "created_at": _DEMO_NOW},
+    ]).convert_dtypes(dtype_backend="pyarrow")
 
 # -------------------------
 # DB Helpers
 # -------------------------
+# The KPI panel counts today's distinct users on every refresh. Without an
+# index that is a seq-scan of user_activities; create this once so it can
+# be answered with an index-only scan:
+#
+#   CREATE INDEX CONCURRENTLY ON user_activities (timestamp, user_id);
+#
+# Every pooled connection also gets a 2s statement_timeout so a bad plan
+# errors out instead of freezing the dashboard.
+#
+# The tab listings read from the mv_recent_* materialized views (setup and
+# refresh schedule in the README), so each rerun sorts at most 1000 rows
+# rather than the whole table. Until the views exist the loaders log once
+# and query the base tables as before.
 @st.cache_resource
-def init_db_conn():
+def init_db_pool():
+    if not DB_CONFIG["host"] or not DB_CONFIG["password"]:
+        return None
+    import psycopg2
+    from psycopg2.pool import ThreadedConnectionPool
     try:
-        if not DB_CONFIG["host"] or not DB_CONFIG["password"]:
-            return None
-        conn = psycopg2.connect(
+        return ThreadedConnectionPool(
+            1, 8,
             host=DB_CONFIG["host"],
             port=DB_CONFIG["port"],
             dbname=DB_CONFIG["dbname"],
             user=DB_CONFIG["user"],
             password=DB_CONFIG["password"],
-            connect_timeout=5
+            connect_timeout=5,
+            options="-c statement_timeout=2000"
         )
-        return conn
-    except Exception:
+    except psycopg2.Error as e:
+        logging.warning("db pool init failed, using demo data: %s", e)
         return None
 
-def safe_read_sql(query: str, conn) -> pd.DataFrame:
+@contextmanager
+def with_conn():
+    # Borrow a pooled connection; broken ones are discarded on return
+    pool = init_db_pool()
+    if pool is None:
+        yield None
+        return
+    conn = pool.getconn()
     try:
-        if conn is None:
-            return pd.DataFrame()
-        return pd.read_sql(query, conn)
-    except Exception:
-        return pd.DataFrame()
+        yield conn
+    finally:
+        pool.putconn(conn, close=bool(conn.closed))
 
-def safe_execute(query: str, params: tuple, conn) -> bool:
+# Process-wide record of missing views, so the fallback is only logged once
+@st.cache_resource
+def _missing_views() -> set:
+    return set()
+
+def fetch_df(query: str, cols: tuple, fallback_query: Optional[str] = None) -> Optional[pd.DataFrame]:
+    # Returns None when the query fails, so callers can tell it from "no rows".
+    # fallback_query runs instead if query references a table that doesn't exist.
+    if init_db_pool() is None:
+        return pd.DataFrame(columns=list(cols))
+    import psycopg2
+    from psycopg2 import errors
+    try:
+        with with_conn() as conn, conn.cursor() as cur:
+            try:
+                cur.execute(query)
+            except errors.UndefinedTable as e:
+                if fallback_query is None:
+                    raise
+                if query not in _missing_views():
+                    _missing_views().add(query)
+                    logging.warning("%s; falling back to the base table", str(e).splitlines()[0])
+                conn.rollback()
+                cur.execute(fallback_query)
+            return pd.DataFrame.from_records(
+                cur.fetchall(), columns=list(cols)
+            ).convert_dtypes(dtype_backend="pyarrow")
+    except psycopg2.Error as e:
+        logging.warning("query failed: %s", e)
+        return None
+
+def safe_execute(query: str, params, many: bool = False) -> bool:
+    # many=True takes a list of param tuples and sends them in pages of 1000
+    if init_db_pool() is None:
+        return False
+    import psycopg2
+    from psycopg2.extras import execute_batch
     try:
-        if conn is None:
-            return False
-        cur = conn.cursor()
-        cur.execute(query, params)
-        conn.commit()
-        cur.close()
-        return True
-    except Exception:
+        with with_conn() as conn:
+            cur = conn.cursor()
+            if many:
+                execute_batch(cur, query, params, page_size=1000)
+            else:
+                cur.execute(query, params)
+            conn.commit()
+            cur.close()
+            return True
+    except psycopg2.Error as e:
+        logging.warning("statement failed: %s", e)
         return False
 
+# -------------------------
+# HTTP Helpers
+# -------------------------
+@st.cache_resource
+def get_http_session():
+    import requests
+    from requests.adapters import HTTPAdapter
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+# Webhooks run on a shared pool so a slow n8n response never blocks the
+# script thread; results are parked in session_state until rendered.
+@st.cache_resource
+def get_webhook_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="webhook")
+
+def post_webhook_async(state_key: str, url: str, payload: dict) -> bool:
+    # One request per key at a time, so an earlier result is never overwritten
+    if state_key in st.session_state:
+        st.warning("⏳ Previous request is still being sent — try again once it finishes.")
+        return False
+    future = get_webhook_executor().submit(get_http_session().post, url, json=payload, timeout=HTTP_TIMEOUT)
+    st.session_state[state_key] = {"future": future, "payload": payload}
+    return True
+
+# Only this status box polls while a webhook is in flight; once it finishes
+# a single full rerun lets show_webhook_result render the outcome.
+@st.fragment(run_every=0.5)
+def _poll_webhook(state_key: str) -> None:
+    pending = st.session_state.get(state_key)
+    if pending is None or pending["future"].done():
+        st.rerun()
+    st.info("⏳ Sending…")
+
+def show_webhook_result(state_key: str, success_msg: str, failure_msg: str) -> None:
+    pending = st.session_state.get(state_key)
+    if pending is None:
+        return
+    if not pending["future"].done():
+        _poll_webhook(state_key)
+        return
+    del st.session_state[state_key]
+    try:
+        r = pending["future"].result()
+    except Exception as e:
+        st.error(f"⚠️ {failure_msg}: {e}")
+        st.json(pending["payload"])
+        return
+    if 200 <= r.status_code < 300:
+        st.success(success_msg)
+        try:
+            st.json(r.json())
+        except ValueError:
+            st.write("Webhook responded (non-JSON).")
+    else:
+        st.error(f"❌ Webhook returned {r.status_code}: {r.text}")
+
 # -------------------------
 # Main Application
 # -------------------------
-conn = init_db_conn()
-db_available = conn is not None
+db_available = init_db_pool() is not None
 
 # KPI panel
+KPI_USERS_TODAY_SQL = (
+    "SELECT COUNT(*) FROM (SELECT DISTINCT user_id FROM user_activities WHERE timestamp >= CURRENT_DATE AND user_id IS NOT NULL) t"
+)
+KPI_SQL = f"""
+SELECT
+    ({KPI_USERS_TODAY_SQL}),
+    (SELECT COUNT(*) FROM campaign_history),
+    (SELECT COUNT(*) FROM campaign_history WHERE COALESCE(open_count,0) > 0 OR COALESCE(click_count,0) > 0);
+"""
+
+# KPI_SQL is prepared server-side once per pooled connection, so refreshes
+# only pay for EXECUTE. The first call on a fresh connection finds no
+# kpi_stmt, prepares it and retries; prepared statements outlive rollbacks.
+def _execute_kpi(conn, cur) -> None:
+    from psycopg2 import errors
+    try:
+        cur.execute("EXECUTE kpi_stmt;")
+    except errors.InvalidSqlStatementName:
+        conn.rollback()
+        cur.execute(f"PREPARE kpi_stmt AS {KPI_SQL}")
+        cur.execute("EXECUTE kpi_stmt;")
+
+# Cached per minute: the bucket argument is only a cache-buster, so the
+# (unhashable) connection pool never becomes part of the cache key. DB errors
+# propagate (Streamlit doesn't cache exceptions) so a failure isn't pinned
+# for the whole TTL.
+@st.cache_data(ttl=60, show_spinner=False)
+def _fetch_aggregates(bucket: int) -> tuple:
+    if init_db_pool() is not None:
+        with with_conn() as conn, conn.cursor() as cur:
+            _execute_kpi(conn, cur)
+            users_today, emails_sent, conversions = cur.fetchone()
+    else:
+        demo_campaigns = _demo_campaigns()
+        users_today = np.unique(_demo_user_activities()["user_id"].to_numpy()).size
+        emails_sent = len(demo_campaigns)
+        conversions = int((demo_campaigns["click_count"].to_numpy() > 0).sum())
+    return int(users_today), int(emails_sent), int(conversions)
+
 def get_aggregates():
+    bucket = int(time.time() // 60)
     if db_available:
+        import psycopg2
         try:
-            users_today = int(safe_read_sql(
-                "SELECT COUNT(DISTINCT user_id) FROM user_activities WHERE timestamp >= CURRENT_DATE;", conn
-            ).iat[0, 0])
-        except:
-            users_today = 0
-        try:
-            emails_sent = int(safe_read_sql("SELECT COUNT(*) FROM campaign_history;", conn).iat[0, 0])
-        except:
-            emails_sent = 0
-        try:
-            conversions = int(safe_read_sql(
-                "SELECT COUNT(*) FROM campaign_history WHERE COALESCE(open_count,0) > 0 OR COALESCE(click_count,0) > 0;", conn
-            ).iat[0, 0])
-        except:
-            conversions = 0
+            users_today, emails_sent, conversions = _fetch_aggregates(bucket)
+        except psycopg2.Error as e:
+            logging.warning("kpi query failed: %s", e)
+            st.warning("Couldn't load live KPIs (see logs) — showing zeros.")
+            users_today, emails_sent, conversions = 0, 0, 0
     else:
-        users_today = _demo_user_activities["user_id"].nunique()
-        emails_sent = len(_demo_campaigns)
-        conversions = _demo_campaigns[(_demo_campaigns["click_count"] > 0)].shape[0]
-
+        users_today, emails_sent, conversions = _fetch_aggregates(bucket)
     success_rate = round((conversions / emails_sent) * 100, 2) if emails_sent > 0 else 0
     return users_today, emails_sent, conversions, success_rate
 
+# Listings prefer the mv_recent_* views and fall back to the base table
+# until the views from the README have been created.
+def _recent_rows(view: str, table: str, cols: tuple, order_by: str, limit: int) -> Optional[pd.DataFrame]:
+    select = f"SELECT {', '.join(cols)} FROM {{}} ORDER BY {order_by} DESC LIMIT {limit};"
+    return fetch_df(select.format(view), cols, fallback_query=select.format(table))
+
+# Tab queries, cached briefly so unrelated widget reruns don't hit the DB.
+# cache_resource hands back the same object without pickling, so callers
+# take a .copy() before using it.
+@st.cache_resource(ttl=15, show_spinner=False)
+def load_activities() -> Optional[pd.DataFrame]:
+    return _recent_rows(
+        "mv_recent_activities", "user_activities",
+        ("id", "user_id", "feature_used", "email", "timestamp"), "timestamp", 20)
+
+@st.cache_resource(ttl=15, show_spinner=False)
+def load_opportunities() -> Optional[pd.DataFrame]:
+    return _recent_rows(
+        "mv_recent_opportunities", "upsell_opportunities",
+        ("id", "user_id", "email", "recommended_feature", "ai_score", "reasoning", "created_at", "status"),
+        "created_at", 50)
+
+@st.cache_resource(ttl=15, show_spinner=False)
+def load_campaigns() -> Optional[pd.DataFrame]:
+    return _recent_rows(
+        "mv_recent_campaigns", "campaign_history",
+        ("id", "opportunity_id", "user_id", "recommended_feature", "subject_line", "email_to", "campaign_type",
+         "ai_score", "sent_at", "delivery_status", "open_count", "click_count"),
+        "sent_at", 50)
+
+# Cheap stand-in for hashing the whole frame on every cached call. Row count
+# and max id miss in-place updates once LIMIT caps the frame, so the columns
+# the charts aggregate are part of the key too (≤50 rows, cheap to hash).
+def _frame_fingerprint(df: pd.DataFrame) -> tuple:
+    aggregated = tuple(tuple(df[col].tolist()) for col in ("status", "click_count") if col in df)
+    return len(df), tuple(df.columns), int(df["id"].max()) if "id" in df and not df.empty else 0, aggregated
+
+# Chart inputs only change when the underlying frames do
+@st.cache_data(show_spinner=False, hash_funcs={pd.DataFrame: _frame_fingerprint})
+def _chart_aggregates(df_ops: pd.DataFrame, df_c: pd.DataFrame) -> tuple:
+    status_counts = df_ops["status"].value_counts() if not df_ops.empty else pd.Series(dtype="int64")
+    sent = len(df_c)
+    converted = int(df_c["click_count"].sum()) if "click_count" in df_c.columns else 0
+    return status_counts, sent, converted
+
+# Vega-Lite specs keyed on small tuples, so unchanged data skips building
+# and validating the Altair charts altogether
+@st.cache_data(show_spinner=False)
+def _status_pie_spec(counts: tuple) -> dict:
+    import altair as alt
+    return alt.Chart(
+        pd.DataFrame(list(counts), columns=["status", "count"])
+    ).mark_arc().encode(theta="count:Q", color="status:N", tooltip=["status", "count"]).to_dict()
+
+@st.cache_data(show_spinner=False)
+def _sent_converted_spec(sent: int, converted: int) -> dict:
+    import altair as alt
+    counts = pd.DataFrame({"label": ["Sent", "Converted"], "count": [sent, converted]})
+    return alt.Chart(counts).mark_bar(size=40).encode(
+        x=alt.X("label:N", sort=None, title=None, axis=alt.Axis(labelAngle=0)),
+        y=alt.Y("count:Q", title="Count"),
+        color=alt.Color("label:N", scale=alt.Scale(domain=["Sent", "Converted"], range=["skyblue", "orange"]), legend=None),
+    ).to_dict()
+
+@st.cache_data(show_spinner=False)
+def _impact_bars_spec(baseline: float, live: float) -> dict:
+    import altair as alt
+    impact = pd.DataFrame({"label": ["Baseline", "Live Agent"], "rate": [baseline, live]})
+    bars = alt.Chart(impact).mark_bar(size=40).encode(
+        x=alt.X("label:N", sort=None, title=None, axis=alt.Axis(labelAngle=0)),
+        y=alt.Y("rate:Q", axis=None, scale=alt.Scale(domain=[0, max(baseline, live) * 1.2])),
+        color=alt.Color("label:N", scale=alt.Scale(range=["gray", "green"]), legend=None),
+    )
+    labels = bars.mark_text(dy=-6, fontSize=10).transform_calculate(
+        text="datum.rate + '%'"
+    ).encode(text="text:N", color=alt.value("black"))
+    return (bars + labels).to_dict()
+
+if st.sidebar.button("🔄 Refresh Data"):
+    st.cache_data.clear()
+    for loader in (load_activities, load_opportunities, load_campaigns):
+        loader.clear()
+
 users_today, emails_sent, conversions, success_rate = get_aggregates()
 
 
@@ -182,122 +428,112 @@ tab_activities, tab_ops, tab_campaigns, tab_analytics = st.tabs(
 
 # Remaining tabs code (same as your current implementation)
 
+# Live frame from a cached loader, or demo data when the DB is off, empty or
+# the query failed (the latter with a visible warning)
+def _live_or_demo(loader, demo, what: str) -> pd.DataFrame:
+    if not db_available:
+        return demo()
+    df = loader()
+    if df is None:
+        st.warning(f"Couldn't load live {what} (see logs) — showing demo data.")
+        return demo()
+    return df.copy() if not df.empty else demo()
+
+def _opportunities_frame() -> pd.DataFrame:
+    return _live_or_demo(load_opportunities, _demo_upsell_ops, "opportunities")
+
+def _campaigns_frame() -> pd.DataFrame:
+    return _live_or_demo(load_campaigns, _demo_campaigns, "campaigns")
+
+# Each tab renders in its own st.fragment, so a widget inside one tab only
+# reruns that tab instead of re-firing every tab's queries.
 
 # TAB: Activities
-with tab_activities:
+@st.fragment
+def _render_activities_tab():
     st.header("📝 Track User Activity")
+    st.session_state.setdefault("session_id", f"session_{int(time.time())}")
     with st.form("activity_form", clear_on_submit=True):
         user_id = st.text_input("User ID", "sarah_designer")
         feature_used = st.selectbox("Feature Used",
                                     ["export_report", "file_share", "integration_setup", "dashboard_view"])
         email = st.text_input("Email", f"{user_id}@example.com")
         plan_type = st.selectbox("Plan Type", ["free", "pro", "enterprise"])
-        session_id = st.text_input("Session ID", f"session_{int(time.time())}")
+        session_id = st.text_input("Session ID", value=st.session_state["session_id"])
         submit = st.form_submit_button("📥 Track Activity")
 
     if submit:
         payload = {"user_id": user_id, "feature": feature_used, "email": email, "plan_type": plan_type,
                    "session_id": session_id, "timestamp": datetime.datetime.utcnow().isoformat()}
-        try:
-            r = requests.post(USER_ACTIVITY_WEBHOOK, json=payload, timeout=8)
-            if 200 <= r.status_code < 300:
-                st.success("✅ Activity sent successfully to n8n webhook.")
-                try:
-                    st.json(r.json())
-                except:
-                    st.write("Webhook responded (non-JSON).")
-            else:
-                st.error(f"❌ Webhook returned {r.status_code}: {r.text}")
-        except Exception as e:
-            st.error(f"⚠️ Failed to call webhook: {e}")
-            st.json(payload)
+        post_webhook_async("activity_webhook", USER_ACTIVITY_WEBHOOK, payload)
+    show_webhook_result("activity_webhook", "✅ Activity sent successfully to n8n webhook.", "Failed to call webhook")
 
     st.markdown("### Recent Activities")
-    if db_available:
-        df_act = safe_read_sql(
-            "SELECT id, user_id, feature_used, email, timestamp FROM user_activities ORDER BY timestamp DESC LIMIT 20;", conn)
-        st.dataframe(df_act if not df_act.empty else _demo_user_activities)
-    else:
-        st.dataframe(_demo_user_activities)
+    st.dataframe(_live_or_demo(load_activities, _demo_user_activities, "activities"))
+
+with tab_activities:
+    _render_activities_tab()
 
 # TAB: Opportunities
-with tab_ops:
+@st.fragment
+def _render_ops_tab():
     st.header("🤖 AI Upsell Opportunities")
-    if db_available:
-        df_ops = safe_read_sql(
-            "SELECT id, user_id, email, recommended_feature, ai_score, reasoning, created_at, status FROM upsell_opportunities ORDER BY created_at DESC LIMIT 50;", conn)
-        if df_ops.empty: df_ops = _demo_upsell_ops
-    else:
-        df_ops = _demo_upsell_ops
+    if not db_available:
         st.warning("DB not connected — showing demo data.")
-
-    st.dataframe(df_ops)
+    st.dataframe(_opportunities_frame())
 
     st.markdown("### Trigger Campaign for Opportunity")
     opp_for_campaign = st.number_input("Opportunity ID", min_value=0, value=0, step=1)
     if st.button("📤 Trigger Campaign"):
         if opp_for_campaign > 0:
             payload = {"opportunity_id": int(opp_for_campaign)}
-            try:
-                r = requests.post(CAMPAIGN_TRIGGER_WEBHOOK, json=payload, timeout=10)
-                if 200 <= r.status_code < 300:
-                    st.success("Campaign trigger sent.")
-                    try:
-                        st.json(r.json())
-                    except:
-                        st.write("Webhook responded (non-json).")
-                else:
-                    st.error(f"Webhook error {r.status_code}: {r.text}")
-            except Exception as e:
-                st.error(f"Failed to call campaign webhook: {e}")
+            post_webhook_async("campaign_webhook", CAMPAIGN_TRIGGER_WEBHOOK, payload)
         else:
             st.warning("Enter valid opportunity id > 0.")
+    show_webhook_result("campaign_webhook", "Campaign trigger sent.", "Failed to call campaign webhook")
+
+with tab_ops:
+    _render_ops_tab()
 
 # TAB: Campaigns
-with tab_campaigns:
+@st.fragment
+def _render_campaigns_tab():
     st.header("📬 Campaign History")
-    if db_available:
-        df_c = safe_read_sql("SELECT * FROM campaign_history ORDER BY sent_at DESC LIMIT 50;", conn)
-        if df_c.empty: df_c = _demo_campaigns
-    else:
-        df_c = _demo_campaigns
+    if not db_available:
         st.warning("DB not connected — showing demo data.")
-    st.dataframe(df_c)
+    st.dataframe(_campaigns_frame())
+
+with tab_campaigns:
+    _render_campaigns_tab()
 
 # TAB: Analytics & Impact
-with tab_analytics:
+@st.fragment
+def _render_analytics_tab():
     st.header("📊 Analytics & Visualizations")
+    df_ops = _opportunities_frame()
+    df_c = _campaigns_frame()
 
     # Container for all 3 graphs
     with st.container():
         st.markdown("### Key Metrics Overview")
         col1, col2, col3 = st.columns(3)
 
+        status_counts, sent, converted = _chart_aggregates(df_ops, df_c)
+
         # Column 1: AI Opportunity Status Pie Chart
-        status_counts = df_ops['status'].value_counts() if not df_ops.empty else pd.Series()
-        fig1, ax1 = plt.subplots(figsize=(3,2.5))
+        col1.markdown("**AI Opportunity Status**")
         if not status_counts.empty:
-            ax1.pie(status_counts, labels=status_counts.index, autopct="%1.1f%%", startangle=90)
-        ax1.set_title("AI Opportunity Status", fontsize=10)
-        col1.pyplot(fig1)
+            counts = tuple((str(k), int(v)) for k, v in status_counts.items())
+            col1.vega_lite_chart(_status_pie_spec(counts), use_container_width=True)
 
         # Column 2: Campaign Sent vs Converted Bar
         if not df_c.empty:
-            fig2, ax2 = plt.subplots(figsize=(3,2.5))
-            ax2.bar(["Sent", "Converted"], [len(df_c), df_c['click_count'].sum() if 'click_count' in df_c.columns else 0], color=['skyblue', 'orange'])
-            ax2.set_ylabel("Count", fontsize=8)
-            ax2.set_title("Campaigns Sent vs Converted", fontsize=10)
-            col2.pyplot(fig2)
+            col2.markdown("**Campaigns Sent vs Converted**")
+            col2.vega_lite_chart(_sent_converted_spec(sent, converted), use_container_width=True)
 
         # Column 3: Agent Impact
-        fig3, ax3 = plt.subplots(figsize=(3,2.5))
-        ax3.bar(["Baseline", "Live Agent"], [BASELINE_RATE, success_rate], color=['gray', 'green'], width=0.35)
-        ax3.set_ylim(0, max(BASELINE_RATE, success_rate)*1.2)
-        ax3.set_yticks([])  # hide y-axis
-        ax3.set_xticks([0,1])
-        ax3.set_xticklabels(["Baseline", "Live Agent"], fontsize=8)
-        ax3.set_title("Agent Impact", fontsize=10)
-        for i, v in enumerate([BASELINE_RATE, success_rate]):
-            ax3.text(i, v + 0.3, f"{v}%", ha='center', fontsize=8)
-        plt.tight_layout()
-        col3.pyplot(fig3)
+        col3.markdown("**Agent Impact**")
+        col3.vega_lite_chart(_impact_bars_spec(BASELINE_RATE, success_rate), use_container_width=True)
+
+with tab_analytics:
+    _render_analytics_tab()